@@ -1,16 +1,97 @@
 import argparse
 import asyncio
 import logging
-import os
+import queue
+import socket
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 from pathlib import Path
 
 from .config_manager import ConfigManager
-from .server import ClientSideConnectionFactory
+from .server import ClientSideConnectionFactory, STREAM_LIMIT
+from .spy_utils import FastRotatingFileHandler
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 
 __version__ = '3.0dev4'
+__all__ = ['main', '__version__']
+
+
+def _ensure_config_tree(config_dir: Path):
+    """
+    Makes sure the configuration directory and its plugin package exist.
+    :param config_dir: Path to the configuration directory, or to a config file inside it.
+    :return: None.
+    """
+    # ConfigManager accepts a path to the config file itself, in which case the plugins live next to it.
+    if config_dir.is_file():
+        config_dir = config_dir.parent
+    plugins = config_dir / "plugins"
+    plugins.mkdir(parents=True, exist_ok=True)
+    (plugins / "__init__.py").touch(exist_ok=True)
+
+
+def _schedule_log_flush(loop, handler, interval):
+    """
+    Periodically flushes a buffering log handler, so low-traffic periods still make it to disk. The flush itself
+    runs on a worker thread, since it writes to the file and contends with the log listener for the handler lock.
+    :param loop: The event loop to schedule the flush on.
+    :param handler: The handler to flush.
+    :param interval: Number of seconds between flushes.
+    :return: None.
+    """
+    def flush():
+        loop.run_in_executor(None, handler.flush)
+        loop.call_later(interval, flush)
+
+    loop.call_later(interval, flush)
+
+
+def _run(coro):
+    """
+    Runs a coroutine to completion on a fresh event loop, using uvloop when it's installed.
+    :param coro: The coroutine to run.
+    :return: Whatever the coroutine returns.
+    """
+    if uvloop is None:
+        return asyncio.run(coro)
+    if hasattr(uvloop, "run"):
+        return uvloop.run(coro)
+    if hasattr(asyncio, "Runner"):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(coro)
+    # Older uvloop on older Pythons only offers the (since deprecated) event loop policy.
+    uvloop.install()
+    return asyncio.run(coro)
+
+
+async def _serve(client_factory, port, log_handler, reuse_port=False):
+    """
+    Runs the proxy server until it's closed or cancelled.
+    :param client_factory: Callback to handle new client connections.
+    :param port: The port to listen on.
+    :param log_handler: A buffering log handler to flush periodically.
+    :param reuse_port: Whether to let other processes bind the same port (SO_REUSEPORT). Off by default, since
+    otherwise a second proxy started by mistake would quietly share connections with this one.
+    :return: None.
+    """
+    logger = logging.getLogger("starrypy")
+    if reuse_port:
+        if hasattr(socket, "SO_REUSEPORT"):
+            logger.info(f"Port reuse is enabled; other processes may also listen on port {port}.")
+        else:
+            logger.warning("Port reuse was requested, but isn't supported on this platform.")
+            reuse_port = False
+    # A deep accept backlog keeps bursts of reconnects from being dropped.
+    server = await asyncio.start_server(client_factory, port=port, limit=STREAM_LIMIT, backlog=2048,
+                                        reuse_port=reuse_port)
+    _schedule_log_flush(asyncio.get_running_loop(), log_handler, 30)
+    async with server:
+        await server.serve_forever()
 
 
 def main():
@@ -32,39 +113,48 @@ def main():
 
     main_logger = logging.getLogger("starrypy")
     aio_logger = logging.getLogger("asyncio")
-    log_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s # %(message)s",
-                                      datefmt='%Y-%m-%d %H:%M:%S')
-    if not args.config.exists():
-        os.makedirs(args.config)
-        os.makedirs(Path.home() / ".starrypy" / "plugins")
-        with open(Path.home() / ".starrypy" / "plugins" / "__init__.py", 'a'):
-            os.utime(Path.home() / ".starrypy" / "plugins" / "__init__.py", None)
-
-    if not args.logfile.exists():
-        args.logfile.touch()
-    file_handler = RotatingFileHandler(args.logfile, maxBytes=1048576, backupCount=3, encoding="utf-8")
+    log_formatter = logging.Formatter("{asctime} - {levelname} - {name} # {message}",
+                                      datefmt='%Y-%m-%d %H:%M:%S', style='{')
+    # None of these show up in our log format, so don't pay to collect them for every record.
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    _ensure_config_tree(args.config)
+    args.logfile.parent.mkdir(parents=True, exist_ok=True)
+    args.logfile.touch(exist_ok=True)
+    file_handler = FastRotatingFileHandler(args.logfile, maxBytes=1048576, backupCount=3, encoding="utf-8")
     file_handler.setFormatter(log_formatter)
+    # Batch up file writes; anything at ERROR or above gets written out immediately.
+    buffered_handler = MemoryHandler(capacity=512, flushLevel=logging.ERROR, target=file_handler, flushOnClose=True)
     stream_handler = logging.StreamHandler()  # This is temporary until urwid gets in
     stream_handler.setFormatter(log_formatter)
 
+    # The handlers doing actual I/O live on a listener thread, so logging from a coroutine never blocks the loop.
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    log_listener = QueueListener(log_queue, buffered_handler, stream_handler, respect_handler_level=True)
+
     main_logger.setLevel(loglevel)
-    main_logger.addHandler(file_handler)
-    main_logger.addHandler(stream_handler)
+    main_logger.addHandler(queue_handler)
     aio_logger.setLevel(loglevel)
-    aio_logger.addHandler(file_handler)
-    aio_logger.addHandler(stream_handler)
+    aio_logger.addHandler(queue_handler)
+    log_listener.start()
 
     main_logger.info("Starting main loop.")
 
+    if uvloop is not None:
+        main_logger.debug("Using uvloop event loop.")
+
     config_mgr = ConfigManager(args)
     client_factory = ClientSideConnectionFactory(config_mgr)
 
     # noinspection PyBroadException
     try:
-        srv = asyncio.start_server(client_factory, port=config_mgr.config['listen_port'])
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(srv)
-        loop.run_forever()
+        _run(_serve(client_factory, config_mgr.config['listen_port'], buffered_handler,
+                    reuse_port=config_mgr.config.get('reuse_port', False)))
     except Exception:
         main_logger.exception("Exception occurred in main loop.", exc_info=True)
         sys.exit(1)
+    finally:
+        log_listener.stop()
+        buffered_handler.close()
@@ -1,8 +1,30 @@
-import inspect
 import logging
 from .decorators import EventHook
 from .enums import PacketType
 from .errors import CommandSyntaxError, UserPermissionError
+from .parser import utf8_string_startswith
+
+
+# Filled in by the Command decorator; maps (module, class qualname) to the names of that class's command methods.
+_command_methods = {}
+
+
+def _get_commands(plugin):
+    """
+    Looks up the bound command methods of a plugin, using the table built up by the Command decorator.
+    :param plugin: The plugin instance.
+    :return: A list of bound command methods.
+    """
+    names = {}
+    for cls in type(plugin).__mro__:
+        for name in _command_methods.get((cls.__module__, cls.__qualname__), ()):
+            names.setdefault(name)
+    commands = []
+    for name in names:
+        mth = getattr(plugin, name)
+        if hasattr(mth, "command"):
+            commands.append(mth)
+    return commands
 
 
 class CommandDispatcher:
@@ -13,70 +35,79 @@ class CommandDispatcher:
         self.default_config = {
             "command_prefix": "/"
         }
-        try:
-            self.conf = factory.config_manager.config["command_dispatcher"]
-        except KeyError:
-            factory.config_manager.config["command_dispatcher"] = self.default_config
-            self.conf = factory.config_manager.config["command_dispatcher"]
+        self.conf = self.config_manager.config.setdefault("command_dispatcher", self.default_config)
+        self._prefix = None
+        self._prefix_bytes = None
+        self._prefix_len = 0
+        self.reload()
         self.commands = {}
+        # Maps each registered command function to every name (including aliases) it was installed under.
+        self._by_fn = {}
+
+    def reload(self):
+        """
+        Re-reads the cached values from the dispatcher's config section. Call this after the config changes.
+        :return: None.
+        """
+        self._prefix = self.conf["command_prefix"]
+        self._prefix_bytes = self._prefix.encode("utf-8")
+        self._prefix_len = len(self._prefix)
 
     def register_plugin(self, plugin):
-        for _, mth in inspect.getmembers(plugin, predicate=lambda x: inspect.ismethod(x) and hasattr(x, "command")):
+        for mth in _get_commands(plugin):
             self.register(mth, mth.name.lower())
 
     def deregister_plugin(self, plugin):
-        for _, mth in inspect.getmembers(plugin, predicate=lambda x: inspect.ismethod(x) and hasattr(x, "command")):
-            self.deregister(mth, mth.name.lower())
+        for mth in _get_commands(plugin):
+            self.deregister(mth)
 
-    def register(self, fn, name, is_alias=False):
+    def register(self, fn, name):
         """
-        Register commands in the command list and handle conflicts. If it's an
-        alias, we don't want it to overwrite non-alias commands. Otherwise,
-        overwrite based on priority, and failing that, load order.
+        Register commands in the command list and handle conflicts. Aliases
+        never overwrite other commands. Otherwise, overwrite based on
+        priority, and failing that, load order.
         :param fn: The command function, with its added information.
         :param name: The command's name, for indexing.
-        :param is_alias: A boolean that tells the registrar not to overwrite other commands.
         :return: None.
         """
+        installed = self._by_fn.setdefault(fn, [])
+        if self._install(fn, name, overwrite=True):
+            installed.append(name)
+        for alias in getattr(fn, "aliases_lower", ()):
+            if self._install(fn, alias, overwrite=False):
+                installed.append(alias)
+
+    def _install(self, fn, name, overwrite):
         self.logger.debug(f"Registering command {name} from {fn.__self__.name}.")
 
-        if name in self.commands:
-            oldfn = self.commands[name]
-            if fn.priority >= oldfn.priority and not is_alias:
-                self.commands[name] = fn
-                self.logger.warning(f"Command {name} from {fn.__self__.name} overwrites command {oldfn.name} from "
-                                    f"{oldfn.__self__.name}!")
-            else:
-                self.logger.warning(f"Command {oldfn.name} from {oldfn.__self__.name} overwrites command {name} from "
-                                    f"{fn.__self__.name}!")
-        else:
+        oldfn = self.commands.get(name)
+        if oldfn is None:
             self.commands[name] = fn
+        elif overwrite and fn.priority >= oldfn.priority:
+            self.commands[name] = fn
+            self.logger.warning(f"Command {name} from {fn.__self__.name} overwrites command {oldfn.name} from "
+                                f"{oldfn.__self__.name}!")
+        else:
+            self.logger.warning(f"Command {oldfn.name} from {oldfn.__self__.name} overwrites command {name} from "
+                                f"{fn.__self__.name}!")
+            return False
+        return True
 
-        if hasattr(fn, "aliases") and not is_alias:
-            for alias in fn.aliases:
-                self.register(fn, alias.lower(), is_alias=True)
-
-    def deregister(self, fn, name, is_alias=False):
+    def deregister(self, fn):
         """
         Deregister commands from the command list when their plugin is deactivated.
         :param fn: The command function, with its added information.
-        :param name: The command's name, for indexing.
-        :param is_alias: A boolean that tells the registrar not to overwrite other commands.
         :return: None.
         """
-        self.logger.debug(f"Deregistering command {name} from {fn.__self__.name}.")
-
-        if name in self.commands:
-            oldfn = self.commands[name]
-            # Make sure the command isn't another plugin's
-            if fn == oldfn:
+        names = self._by_fn.pop(fn, None)
+        if names is None:
+            self.logger.debug(f"Could not deregister command {fn.name}, no such command!")
+            return
+        for name in names:
+            self.logger.debug(f"Deregistering command {name} from {fn.__self__.name}.")
+            # Make sure the command hasn't since been overwritten by another plugin's
+            if self.commands.get(name) == fn:
                 del self.commands[name]
-        else:
-            self.logger.debug(f"Could not deregister command {name}, no such command!")
-
-        if hasattr(fn, "aliases") and not is_alias:
-            for alias in fn.aliases:
-                self.deregister(fn, alias, is_alias=True)
 
     # noinspection PyBroadException
     async def run_command(self, command, packet, client):
@@ -89,8 +120,7 @@ class CommandDispatcher:
         except CommandSyntaxError as e:
             err = e if e else "Invalid syntax."
             if fn.syntax:
-                deco = self.conf["command_prefix"]
-                await client.send_message(f"{err}\nSyntax: {deco}{fn.name} {fn.syntax}.")
+                await client.send_message(f"{err}\nSyntax: {self._prefix}{fn.name} {fn.syntax}.")
             else:
                 await client.send_message(err)
         except UserPermissionError as e:
@@ -103,14 +133,17 @@ class CommandDispatcher:
     # Event hooks
     @EventHook(PacketType.CHAT_SENT, priority=99)
     async def command_check(self, packet, client):
-        deco = self.conf["command_prefix"]
+        # Check the raw chat text first, so that regular chat never has to go through the parsed data.
+        if packet.data and not utf8_string_startswith(packet.data, self._prefix_bytes):
+            return False
         content = packet.parsed_data["text"]
-        if content.startswith(deco):
-            cmd = content[len(deco):].split()[0].lower()
+        if content.startswith(self._prefix):
+            cmd = content[self._prefix_len:].partition(" ")[0].lower()
             if cmd in self.commands:
                 await self.run_command(cmd, packet, client)
             else:
-                await client.send_message(f"Command {cmd} does not exist. Try {deco}help for a list of commands.")
+                await client.send_message(f"Command {cmd} does not exist. "
+                                          f"Try {self._prefix}help for a list of commands.")
         return False
 
 
@@ -120,6 +153,7 @@ class Command:
     interface for all commands, including roles, documentation, usage syntax,
     and aliases.
     """
+    __slots__ = ("name", "aliases", "category", "doc", "syntax", "perms", "priority")
 
     def __init__(self, name, *aliases, perms=set(), doc=None, syntax=None, priority=0, category="other"):
         if syntax is None:
@@ -130,6 +164,7 @@ class Command:
             doc = ""
         if isinstance(perms, str):
             perms = {perms}
+        perms = frozenset(perms)
         self.name = name
         self.aliases = aliases
         self.category = category
@@ -146,19 +181,29 @@ class Command:
         :return: The now-wrapped command, with all the trappings.
         """
 
-        async def wrapped(s, packet, client):
-            #  user_perms = client.player.permissions
-            user_perms = set()  # Player manager isn't implemented yet, so can't do permission checks.
-            if not user_perms >= self.perms:
-                raise UserPermissionError
-            return await f(s, packet, client)
+        required = self.perms
+        if required:
+            async def wrapped(s, packet, client):
+                #  user_perms = client.player.permissions
+                user_perms = set()  # Player manager isn't implemented yet, so can't do permission checks.
+                if not required.issubset(user_perms):
+                    raise UserPermissionError
+                return await f(s, packet, client)
+        else:
+            # Nothing to check, so don't bother paying for it on every call.
+            async def wrapped(s, packet, client):
+                return await f(s, packet, client)
 
         wrapped.command = True
         wrapped.aliases = self.aliases
+        wrapped.aliases_lower = tuple(alias.lower() for alias in self.aliases)
         wrapped.__doc__ = self.doc
         wrapped.name = self.name
         wrapped.perms = self.perms
         wrapped.syntax = self.syntax
         wrapped.priority = self.priority
         wrapped.category = self.category
+        owner, _, attr = f.__qualname__.rpartition(".")
+        if owner:
+            _command_methods.setdefault((f.__module__, owner), []).append(attr)
         return wrapped
@@ -3,6 +3,11 @@ import yaml
 from pathlib import Path
 from shutil import copyfile
 
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
 
 class ConfigManager:
     def __init__(self, argv):
@@ -24,7 +29,7 @@ class ConfigManager:
 
         try:
             with self.config_path.open(encoding="utf-8") as fp:
-                conf = yaml.safe_load(fp)
+                conf = yaml.load(fp, Loader=SafeLoader)
         except FileNotFoundError:
             self.logger.error(f"File {self.config_path.expanduser()} does not exist! Copying default.")
             copyfile(default_config, self.config_path)
@@ -38,6 +43,6 @@ class ConfigManager:
     def save_config(self):
         temp_path = self.config_path.with_suffix(".yaml.temp")
         with temp_path.open("w", encoding="utf-8") as fp:
-            yaml.safe_dump(self.config, fp)
+            yaml.dump(self.config, fp, Dumper=SafeDumper)
         temp_path.replace(self.config_path)
         self.logger.debug("Saved config file.")
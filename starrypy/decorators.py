@@ -1,14 +1,12 @@
-class EventHook:
+def EventHook(event: int, priority: int=0):
     """
     A decorator to point out to the plugin manager which classes are event hooks, and for what event, along with
     sorting priority. Otherwise doesn't do anything by itself.
     """
+    event = int(event)  # Plain ints keep the event hook lookups off of the enum machinery
 
-    def __init__(self, event: int, priority: int=0):
-        self.event = event
-        self.priority = priority
-
-    def __call__(self, f):
-        f.event = self.event
-        f.priority = self.priority
+    def deco(f):
+        f.event = event
+        f.priority = priority
         return f
+    return deco
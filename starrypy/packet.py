@@ -1,86 +1,241 @@
 import asyncio
-import zlib
+import os
+from functools import partial
+from typing import List, Optional, Union
 
-from .enums import PacketType, PacketDirection
-from .parser import parse_packet, build_packet
-from .spy_utils import read_vlq_signed
+try:
+    from isal import isal_zlib as zlib
+except ImportError:
+    import zlib
+
+try:
+    from xxhash import xxh3_64_intdigest
+except ImportError:
+    _digest = hash
+else:
+    # Packet hashes key the parse cache, so like hash() on bytes, xxh3 gets a random per-process seed; otherwise a
+    # client could craft packets that collide with (and get handed the parse of) someone else's.
+    _digest = partial(xxh3_64_intdigest, seed=int.from_bytes(os.urandom(8), "big"))
+
+from .enums import DIRECTION_NAMES, PACKET_TYPE_NAMES
+from .parser import parse_packet, build_packet, decode_packet
 
 
 class Packet:
-    def __init__(self, packet_type: int, data: bytes, direction: int,
-                 size: int=None, compressed=False, original_data: bytes=None, parsed_data: dict=None):
+    __slots__ = ("type", "size", "compressed", "_data", "_raw_data", "_original_data", "_hash", "direction",
+                 "_parsed_data", "_edited_data")
+
+    def __init__(self, packet_type: int, data: Optional[bytes], direction: int,
+                 size: Union[int, bytes]=None, compressed: bool=False, original_data: Union[bytes, memoryview]=None,
+                 parsed_data: dict=None, raw_data: Union[bytes, memoryview]=None):
         self.type = packet_type
         self.size = size
         self.compressed = compressed
-        self.data = data
-        self.original_data = original_data
+        # Packets that come in off the wire only hold on to their payload as it was on the wire (usually a
+        # memoryview), and only copy or decompress it if something actually looks at their data.
+        self._data = data
+        self._raw_data = raw_data
+        self._original_data = original_data
+        self._hash = None
         self.direction = direction
-        if parsed_data is None:
-            self.parsed_data = {}
-        else:
-            self.parsed_data = parsed_data
-        self.edited_data = {}
-        self.parse = lambda: parse_packet(self)
-        self.build = lambda: build_packet(self)
+        # Most packets are only ever forwarded, so these don't get made (or parsed) until something asks for them.
+        self._parsed_data = parsed_data
+        self._edited_data = None
 
     @classmethod
-    async def from_parsed(cls, packet_type: int, parsed_data: dict, direction: int=0):
+    async def from_parsed(cls, packet_type: int, parsed_data: dict, direction: int=0) -> "Packet":
         """
         Takes in parsed packet data (for example, as built by a plugin) and returns a fully-built packet,
         ready for sending.
         :param packet_type: A PacketType value indicating the type of packet to build.
         :param parsed_data: A dictionary containing parsed data appropriate to the packet.
-        :param direction: A PacketDirection indicating which way the packet should be going. Optional on
-        non-bidirectional packets.
+        :param direction: TO_CLIENT or TO_SERVER (from enums), indicating which way the packet should be going.
+        Optional on non-bidirectional packets.
         :return: A fully-built Packet object.
         """
-        return await cls(packet_type, b"", direction, parsed_data=parsed_data).build()
+        return await cls(int(packet_type), b"", direction, parsed_data=parsed_data).build()
+
+    @property
+    def data(self) -> Optional[bytes]:
+        if self._data is None and self._raw_data is not None:
+            if self.compressed:
+                # Starting zlib off with a buffer near the final size saves it from growing and joining one after.
+                self._data = zlib.decompress(self._raw_data, bufsize=len(self._raw_data) << 2)
+            else:
+                self._data = bytes(self._raw_data)
+            self._raw_data = None
+        return self._data
+
+    @data.setter
+    def data(self, value: Optional[bytes]):
+        self._data = value
+        self._raw_data = None
+
+    @property
+    def original_data(self) -> Union[bytes, memoryview]:
+        return self._original_data
+
+    @original_data.setter
+    def original_data(self, value: Union[bytes, memoryview]):
+        self._original_data = value
+        self._hash = None
+
+    @property
+    def parsed_data(self) -> dict:
+        # Parsing is put off until something actually reads the parsed data, since most hooks can decide what to do
+        # from the packet type or a glance at the raw data.
+        if self._parsed_data is None:
+            if self._data is None and self._raw_data is None:
+                self._parsed_data = {}
+            else:
+                self._parsed_data = decode_packet(self)
+        return self._parsed_data
 
-    def copy(self):
-        return Packet(self.type, self.data, self.direction, size=self.size, compressed=self.compressed,
-                      original_data=self.original_data, parsed_data=self.parsed_data)
+    @parsed_data.setter
+    def parsed_data(self, value: dict):
+        self._parsed_data = value
+
+    @property
+    def edited_data(self) -> dict:
+        if self._edited_data is None:
+            self._edited_data = {}
+        return self._edited_data
+
+    @edited_data.setter
+    def edited_data(self, value: dict):
+        self._edited_data = value
+
+    async def parse(self) -> "Packet":
+        return await parse_packet(self)
+
+    async def build(self) -> "Packet":
+        return await build_packet(self)
+
+    def copy(self) -> "Packet":
+        return Packet(self.type, self._data, self.direction, size=self.size, compressed=self.compressed,
+                      original_data=self.original_data, parsed_data=self._parsed_data,
+                      raw_data=self._raw_data)
 
     async def build_edits(self):
-        if self.edited_data:
-            self.parsed_data.update(self.edited_data)
+        if self._edited_data:
+            self.parsed_data.update(self._edited_data)
             await self.build()
 
     def __repr__(self):
-        return f"<Packet type={PacketType(self.type)} direction={PacketDirection(self.direction)}>"
+        return (f"<Packet type={PACKET_TYPE_NAMES.get(self.type, self.type)} "
+                f"direction={DIRECTION_NAMES.get(self.direction, self.direction)}>")
 
-    def __hash__(self):
-        return hash(self.original_data)
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = _digest(self._original_data)
+        return self._hash
 
 
-async def read_packet(stream, direction):
+class PacketReader:
     """
-    Given an interface to read from (reader) read the next packet that comes
-    in. Determine the packet's type, decode its contents, and track the
-    direction it is flowing. Store this all in a packet object, and return it
-    for further processing down the line.
-    :param stream: Stream from which to read the packet.
-    :param direction: Destination for the packet (SERVER or CLIENT).
-    :return: Packet: Contains both raw and decoded versions of the packet.
+    Reads packets off of a stream. Rather than awaiting the stream for every
+    piece of every packet, data is pulled in a chunk at a time, and as many
+    packets as are complete get decoded straight out of the buffer before the
+    stream is awaited again.
+
+    The buffer is an immutable bytes object that gets replaced (never resized)
+    as more data comes in, so the packets handed out can hold memoryview
+    windows into it instead of copies.
     """
-    compressed = False
-
-    packet_type = await stream.readexactly(1)
-    packet_size, packet_size_data = await read_vlq_signed(stream)
-    if packet_size < 0:
-        packet_size = abs(packet_size)
-        compressed = True
-
-    data = await stream.readexactly(packet_size)
-    p_type_int = ord(packet_type)
-
-    if compressed:
-        try:
-            final_data = zlib.decompress(data)
-        except zlib.error:
-            raise asyncio.IncompleteReadError
-    else:
-        final_data = data
-    original_data = packet_type + packet_size_data + data
-
-    return Packet(p_type_int, final_data, direction,
-                  size=packet_size_data, compressed=compressed, original_data=original_data)
+
+    def __init__(self, stream, direction: int, chunk_size: int=65536):
+        """
+        :param stream: Stream from which to read packets.
+        :param direction: Destination for the packets (SERVER or CLIENT).
+        :param chunk_size: How much to ask the stream for at a time.
+        """
+        self.stream = stream
+        self.direction = direction
+        self.chunk_size = chunk_size
+        self._buf = b""
+        self._view = memoryview(self._buf)
+        self._pos = 0
+        self._needed = 0
+
+    async def _fill(self, needed: int) -> None:
+        """
+        Reads from the stream until at least `needed` unconsumed bytes are buffered.
+        :param needed: The number of unconsumed bytes required.
+        :return: None.
+        """
+        parts = [self._view[self._pos:]]
+        have = len(parts[0])
+        while have < needed:
+            chunk = await self.stream.read(max(self.chunk_size, needed - have))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"".join(parts), needed)
+            parts.append(chunk)
+            have += len(chunk)
+        if len(parts) == 2 and not parts[0]:
+            self._buf = parts[1]
+        else:
+            self._buf = b"".join(parts)
+        self._view = memoryview(self._buf)
+        self._pos = 0
+
+    def _decode(self) -> Optional[Packet]:
+        """
+        Decodes the next packet out of the buffer, without touching the stream.
+        :return: Packet: The next packet, or None if it hasn't been fully buffered yet. In that case, _needed is
+        set to the number of bytes that have to be buffered before trying again.
+        """
+        buf = self._buf
+        start = self._pos
+        # Packet type, followed by the packet size as a signed VLQ
+        offset = start + 1
+        value = 0
+        while True:
+            if offset >= len(buf):
+                self._needed = offset - start + 1
+                return None
+            tmp = buf[offset]
+            offset += 1
+            value = (value << 7) | (tmp & 0x7f)
+            if tmp & 0x80 == 0:
+                break
+        # The size is zigzag encoded, and negative for compressed packets; go straight to the magnitude.
+        compressed = value & 1
+        packet_size = (value >> 1) + compressed
+
+        end = offset + packet_size
+        if end > len(buf):
+            self._needed = end - start
+            return None
+        self._pos = end
+
+        view = self._view
+        return Packet(buf[start], None, self.direction, size=buf[start + 1:offset], compressed=bool(compressed),
+                      original_data=view[start:end], raw_data=view[offset:end])
+
+    async def read_packet(self) -> Packet:
+        """
+        Read the next packet that comes in. Determine the packet's type,
+        decode its contents, and track the direction it is flowing. Store
+        this all in a packet object, and return it for further processing
+        down the line.
+        :return: Packet: Contains both raw and decoded versions of the packet.
+        """
+        while True:
+            packet = self._decode()
+            if packet is not None:
+                return packet
+            await self._fill(self._needed)
+
+    async def read_packets(self) -> List[Packet]:
+        """
+        Like read_packet, but returns every packet that's already been fully
+        buffered along with the next one, so that a busy stream is only
+        awaited once per batch.
+        :return: list: One or more Packets, in the order they came in.
+        """
+        packets = [await self.read_packet()]
+        packet = self._decode()
+        while packet is not None:
+            packets.append(packet)
+            packet = self._decode()
+        return packets
@@ -1,15 +1,29 @@
-import io
 import logging
 import struct
-import zlib
-from asyncio import sleep
-from binascii import hexlify, unhexlify
-from typing import BinaryIO, Callable, List, Dict, Any, Union, Hashable, Optional
+from asyncio import get_running_loop, sleep
+from collections import OrderedDict
+from functools import lru_cache
+from sys import intern
+from time import monotonic
+from typing import Callable, List, Dict, Any, Union, Hashable, Optional
+
+try:
+    from isal import isal_zlib as zlib
+except ImportError:
+    import zlib
 
 from .enums import PacketType, WarpType, WarpWorldType, SystemLocationType
 
 
-_cache = {}
+# Parsed packet cache, keyed by packet hash; kept in least- to most-recently-used order so it can be capped.
+_cache = OrderedDict()
+CACHE_SIZE = 4096
+# Packets smaller than this (header included) skip the cache altogether
+CACHE_MIN_SIZE = 32
+# Packets bigger than this get compressed on a worker thread, so they don't hold up the event loop
+COMPRESS_OFFLOAD_SIZE = 4096
+# Fastest setting; Starbound's packets are small and repetitive enough that higher levels barely shrink them further
+COMPRESSION_LEVEL = 1
 parser_logger = logging.getLogger("starrypy.parser")
 
 JsonType = Union[None, bool, int, float, str, List["JsonType"], Dict[str, "JsonType"]]
@@ -32,18 +46,46 @@ struct_cache = {
     "vec3i": struct.Struct(">3l")
 }
 
+
+class BufferCursor:
+    """
+    A lightweight, read-only stand-in for io.BytesIO over a packet's data. It
+    supports read(), but the parsing primitives work on buf and pos directly,
+    so nothing gets sliced out or copied unless a value actually needs it.
+    """
+    __slots__ = ("buf", "pos")
+
+    def __init__(self, data: bytes):
+        self.buf = memoryview(data)
+        self.pos = 0
+
+    def read(self, size: int=-1) -> bytes:
+        start = self.pos
+        end = len(self.buf)
+        if 0 <= size < end - start:
+            end = start + size
+        self.pos = end
+        return self.buf[start:end].tobytes()
+
+
 # Basic data type parsing
 
 
-def parse_byte(stream: BinaryIO) -> int:
-    return ord(stream.read(1))
+def parse_byte(stream: BufferCursor) -> int:
+    value = stream.buf[stream.pos]
+    stream.pos += 1
+    return value
+
+
+# Every possible single byte, built once, so build_byte is just a lookup
+_byte_values = tuple(bytes((i,)) for i in range(256))
 
 
 def build_byte(obj: int) -> bytes:
-    return obj.to_bytes(1, byteorder="big", signed=False)
+    return _byte_values[obj]
 
 
-def parse_with_struct(stream: BinaryIO, data_type: str) -> Union[bool, int, float, tuple]:
+def parse_with_struct(stream: BufferCursor, data_type: str) -> Union[bool, int, float, tuple]:
     """
     This function takes an input stream and transforms it into a variety of data types, depending on data_type.
     :param stream: A stream object of raw bytes.
@@ -51,7 +93,8 @@ def parse_with_struct(stream: BinaryIO, data_type: str) -> Union[bool, int, floa
     :return: The unpacked value.
     """
     s = struct_cache[data_type]
-    unpacked = s.unpack(stream.read(s.size))
+    unpacked = s.unpack_from(stream.buf, stream.pos)
+    stream.pos += s.size
     if len(unpacked) == 1:  # Don't return a tuple if there's only one element
         unpacked = unpacked[0]
     return unpacked
@@ -64,196 +107,456 @@ def build_with_struct(obj: Union[bool, int, float, tuple], data_type: str) -> by
     :param data_type: str, the struct type to use. Valid values are listed in struct_cache.
     :return: bytes: The packed form of the input data.
     """
-    return struct_cache[data_type].pack(obj)
+    s = struct_cache[data_type]
+    if isinstance(obj, (tuple, list)):
+        return s.pack(*obj)
+    return s.pack(obj)
 
 
-def parse_vlq(stream: BinaryIO) -> int:
-    value = 0
-    while True:
-        try:
-            tmp = ord(stream.read(1))
+# Shortcuts for struct types that get passed around as parse/build functions (e.g. to parse_maybe), so that
+# callers don't need to wrap parse_with_struct in a lambda. These call straight into the pre-built structs.
+
+_unpack_bool = struct_cache["bool"].unpack_from
+_pack_bool = struct_cache["bool"].pack
+_unpack_float = struct_cache["float"].unpack_from
+_pack_float = struct_cache["float"].pack
+_unpack_double = struct_cache["double"].unpack_from
+_pack_double = struct_cache["double"].pack
+_unpack_vec2ui = struct_cache["vec2ui"].unpack_from
+_pack_vec2ui = struct_cache["vec2ui"].pack
+
+
+def parse_float(stream: BufferCursor) -> float:
+    value, = _unpack_float(stream.buf, stream.pos)
+    stream.pos += 4
+    return value
+
+
+def build_float(obj: float) -> bytes:
+    return _pack_float(obj)
+
+
+def parse_double(stream: BufferCursor) -> float:
+    value, = _unpack_double(stream.buf, stream.pos)
+    stream.pos += 8
+    return value
+
+
+def build_double(obj: float) -> bytes:
+    return _pack_double(obj)
+
+
+def parse_bool(stream: BufferCursor) -> bool:
+    value, = _unpack_bool(stream.buf, stream.pos)
+    stream.pos += 1
+    return value
+
+
+def build_bool(obj: bool) -> bytes:
+    return _pack_bool(obj)
+
+
+def parse_vec2ui(stream: BufferCursor) -> tuple:
+    value = _unpack_vec2ui(stream.buf, stream.pos)
+    stream.pos += 8
+    return value
+
+
+def build_vec2ui(obj: tuple) -> bytes:
+    return _pack_vec2ui(*obj)
+
+
+def parse_vlq(stream: BufferCursor) -> int:
+    buf = stream.buf
+    pos = stream.pos
+    try:
+        tmp = buf[pos]
+    except IndexError:
+        return 0
+    pos += 1
+    # Almost every VLQ in practice is a single byte, so get those out of the way without looping
+    if tmp < 0x80:
+        stream.pos = pos
+        return tmp
+    value = tmp & 0x7f
+    try:
+        while True:
+            tmp = buf[pos]
+            pos += 1
             value = (value << 7) | (tmp & 0x7f)
             if tmp & 0x80 == 0:
                 break
-        except TypeError:
-            break
+    except IndexError:
+        pass
+    stream.pos = pos
     return value
 
 
 def build_vlq(obj: int) -> bytes:
-    result = bytearray()
-    value = int(obj)
-    if obj == 0:
-        result = bytearray(b'\x00')
-    else:
-        while value > 0:
-            byte = value & 0x7f
-            value >>= 7
-            if value != 0:
-                byte |= 0x80
-            result.insert(0, byte)
-        if len(result) > 1:
-            result[0] |= 0x80
-            result[-1] ^= 0x80
+    value = obj
+    if value < 0x80:
+        return bytes((value,))
+    # The encoded size is known up front, so fill it in from the last (least significant) byte backwards
+    i = (value.bit_length() + 6) // 7 - 1
+    result = bytearray(i + 1)
+    result[i] = value & 0x7f
+    value >>= 7
+    while value:
+        i -= 1
+        result[i] = (value & 0x7f) | 0x80
+        value >>= 7
     return bytes(result)
 
 
-def parse_signed_vlq(stream: BinaryIO) -> int:
+def parse_signed_vlq(stream: BufferCursor) -> int:
+    # Zigzag decoding; the low bit is the sign
     v = parse_vlq(stream)
-    if (v & 1) == 0x00:
-        return v >> 1
-    else:
-        return -((v >> 1) + 1)
+    return (v >> 1) ^ -(v & 1)
 
 
 def build_signed_vlq(obj: int) -> bytes:
-    value = abs(obj * 2)
-    if obj < 0:
-        value -= 1
-    return build_vlq(value)
+    return build_vlq(obj << 1 if obj >= 0 else (-obj << 1) - 1)
 
 
-def parse_byte_array(stream: BinaryIO) -> bytes:
+def parse_byte_array(stream: BufferCursor) -> bytes:
     array_len = parse_vlq(stream)
-    return stream.read(array_len)
+    start = stream.pos
+    res = stream.buf[start:start + array_len].tobytes()
+    stream.pos = start + len(res)
+    return res
 
 
 def build_byte_array(obj: bytes) -> bytes:
     return build_vlq(len(obj)) + obj
 
 
-def parse_utf8_string(stream: BinaryIO) -> str:
-    return parse_byte_array(stream).decode("utf-8")
+def parse_utf8_string(stream: BufferCursor) -> str:
+    # Decode straight out of the buffer, instead of copying the string's bytes out first
+    string_len = parse_vlq(stream)
+    start = stream.pos
+    res = stream.buf[start:start + string_len]
+    stream.pos = start + len(res)
+    return str(res, "utf-8")
 
 
 def build_utf8_string(obj: str) -> bytes:
     return build_byte_array(obj.encode("utf-8"))
 
 
-def parse_string_set(stream: BinaryIO) -> List[str]:
+def utf8_string_startswith(data: bytes, prefix: bytes) -> bool:
+    """
+    Checks whether the string encoded at the start of data begins with prefix, without decoding anything.
+    :param data: Raw bytes, starting with a VLQ-prefixed UTF-8 string.
+    :param prefix: The encoded prefix to look for.
+    :return: bool: Whether or not the string starts with the prefix.
+    """
+    length = 0
+    offset = 0
+    try:
+        while True:
+            tmp = data[offset]
+            offset += 1
+            length = (length << 7) | (tmp & 0x7f)
+            if tmp & 0x80 == 0:
+                break
+    except IndexError:
+        return False
+    return length >= len(prefix) and data.startswith(prefix, offset)
+
+
+def parse_string_set(stream: BufferCursor) -> List[str]:
     set_len = parse_vlq(stream)
     return [parse_utf8_string(stream) for _ in range(set_len)]
 
 
 def build_string_set(obj: List[str]) -> bytes:
-    res = b''
-    res += build_vlq(len(obj))
-    return res + b"".join(x.encode("utf-8") for x in obj)
+    res = bytearray(build_vlq(len(obj)))
+    for string in obj:
+        res += build_utf8_string(string)
+    return bytes(res)
 
 
-def parse_uuid(stream: BinaryIO) -> bytes:
-    return hexlify(stream.read(16))
+def parse_uuid(stream: BufferCursor) -> bytes:
+    # UUIDs are kept as their raw 16 bytes; call .hex() on them wherever they need to be shown or stored as text
+    start = stream.pos
+    stream.pos = start + 16
+    return stream.buf[start:start + 16].tobytes()
 
 
 def build_uuid(obj: bytes) -> bytes:
-    return unhexlify(obj)
+    return obj
 
 
-def parse_json(stream: BinaryIO) -> JsonType:
+def parse_json(stream: BufferCursor) -> JsonType:
     t = parse_byte(stream)
-    if t == 1:
-        # null
-        return None
-    elif t == 2:
-        # floating-point
-        return parse_with_struct(stream, "double")
-    elif t == 3:
-        # boolean
-        return parse_with_struct(stream, "bool")
-    elif t == 4:
-        # integer
-        return parse_signed_vlq(stream)
-    elif t == 5:
-        # string
-        return parse_utf8_string(stream)
-    elif t == 6:
-        # array
-        return parse_json_array(stream)
-    elif t == 7:
-        # object (map or dictionary)
-        return parse_json_object(stream)
-    else:
+    parser = _json_parsers.get(t)
+    if parser is None:
         raise ValueError(f"Json does not have type with index {t}!")
+    return parser(stream)
 
 
 def build_json(obj: JsonType) -> bytes:
-    res = b""
-    if obj is None:
-        res += b"\x01"
-    elif isinstance(obj, float):
-        res += b"\x02" + build_with_struct(obj, "double")
-    elif isinstance(obj, bool):
-        res += b"\x03" + build_with_struct(obj, "bool")
-    elif isinstance(obj, int):
-        res += b"\x04" + build_signed_vlq(obj)
-    elif isinstance(obj, str):
-        res += b"\x05" + build_utf8_string(obj)
-    elif isinstance(obj, list):
-        res += b"\x06" + build_json_array(obj)
-    elif isinstance(obj, dict):
-        res += b"\x07" + build_json_object(obj)
-    else:
-        raise TypeError(f"Object with type {type(obj)} is not a valid JSON object!")
-    return res
+    res = bytearray()
+    _write_json(obj, res)
+    return bytes(res)
+
 
+def _write_json(obj: JsonType, out: bytearray) -> None:
+    """
+    Does the actual work for build_json. Nested values are all written into the one output buffer, rather than each
+    being built into bytes of their own that then get copied into their parent.
+    :param obj: The JSON value to write.
+    :param out: The buffer to write it to.
+    :return: None.
+    """
+    writer = _json_writers.get(type(obj))
+    if writer is None:
+        # Subclasses (IntEnums, OrderedDicts and the like) get written as the first base type they match
+        for json_type, writer in _json_writers.items():
+            if isinstance(obj, json_type):
+                break
+        else:
+            raise TypeError(f"Object with type {type(obj)} is not a valid JSON object!")
+    writer(obj, out)
+
+
+def _write_json_array(obj: List[JsonType], out: bytearray) -> None:
+    out += build_vlq(len(obj))
+    for value in obj:
+        _write_json(value, out)
+
+
+def _write_json_object(obj: Dict[str, JsonType], out: bytearray) -> None:
+    out += build_vlq(len(obj))
+    for key, value in obj.items():
+        out += _build_json_key(key)
+        _write_json(value, out)
+
+
+@lru_cache(maxsize=4096)
+def _build_json_key(key: str) -> bytes:
+    # Object keys come from a small, fixed set of names, so there's no point encoding the same ones over and over
+    return build_utf8_string(key)
 
-def parse_json_array(stream: BinaryIO) -> List[JsonType]:
+
+def parse_json_array(stream: BufferCursor) -> List[JsonType]:
     return parse_set(stream, parse_json)
 
 
 def build_json_array(obj: List[JsonType]) -> bytes:
-    return build_set(obj, build_json)
+    res = bytearray()
+    _write_json_array(obj, res)
+    return bytes(res)
+
+
+def parse_json_object(stream: BufferCursor) -> Dict[str, JsonType]:
+    return parse_hashmap(stream, _parse_json_key, parse_json)
 
 
-def parse_json_object(stream: BinaryIO) -> Dict[str, JsonType]:
-    return parse_hashmap(stream, parse_utf8_string, parse_json)
+def _parse_json_key(stream: BufferCursor) -> str:
+    # Interned, since the same few key names turn up in object after object; other strings (chat and such) aren't
+    return intern(parse_utf8_string(stream))
 
 
 def build_json_object(obj: Dict[str, JsonType]) -> bytes:
-    return build_hashmap(obj, build_utf8_string, build_json)
+    res = bytearray()
+    _write_json_object(obj, res)
+    return bytes(res)
+
+
+def _parse_json_null(_) -> None:
+    return None
+
+
+def _write_json_null(_, out: bytearray) -> None:
+    out += b"\x01"
+
+
+def _write_json_double(obj: float, out: bytearray) -> None:
+    out += b"\x02"
+    out += _pack_double(obj)
+
+
+def _write_json_bool(obj: bool, out: bytearray) -> None:
+    out += b"\x03\x01" if obj else b"\x03\x00"
+
+
+def _write_json_int(obj: int, out: bytearray) -> None:
+    out += b"\x04"
+    out += build_signed_vlq(obj)
+
+
+def _write_json_string(obj: str, out: bytearray) -> None:
+    out += b"\x05"
+    out += build_utf8_string(obj)
+
+
+def _write_json_array_value(obj: List[JsonType], out: bytearray) -> None:
+    out += b"\x06"
+    _write_json_array(obj, out)
+
+
+def _write_json_object_value(obj: Dict[str, JsonType], out: bytearray) -> None:
+    out += b"\x07"
+    _write_json_object(obj, out)
+
+
+# JSON type tag -> parser, and Python type -> writer (which also writes the tag), so neither direction has to work
+# its way down an if/elif chain for every value. The writers are in the order that subclasses get matched in, so
+# bool has to stay ahead of int.
+
+_json_parsers = {
+    1: _parse_json_null,
+    2: parse_double,
+    3: parse_bool,
+    4: parse_signed_vlq,
+    5: parse_utf8_string,
+    6: parse_json_array,
+    7: parse_json_object
+}
+
+_json_writers = {
+    type(None): _write_json_null,
+    float: _write_json_double,
+    bool: _write_json_bool,
+    int: _write_json_int,
+    str: _write_json_string,
+    list: _write_json_array_value,
+    dict: _write_json_object_value
+}
 
 # Higher-level data object parsing functions
 
 
-def parse_maybe(stream: BinaryIO,
-                data_type: Callable[[BinaryIO], Any]) -> Optional:
-    if parse_with_struct(stream, "bool"):
+def parse_maybe(stream: BufferCursor,
+                data_type: Callable[[BufferCursor], Any]) -> Optional:
+    if parse_bool(stream):
         return data_type(stream)
     return None
 
 
 def build_maybe(obj: Optional, data_type: Callable[[Any], bytes]) -> bytes:
     if obj is not None:
-        return build_with_struct(True, "bool") + data_type(obj)
-    return build_with_struct(False, "bool")
+        return b"\x01" + data_type(obj)
+    return b"\x00"
 
 
-def parse_set(stream: BinaryIO, data_type: Callable[[BinaryIO], Any]) -> List:
+def parse_set(stream: BufferCursor, data_type: Callable[[BufferCursor], Any]) -> List:
     set_len = parse_vlq(stream)
     return [data_type(stream) for _ in range(set_len)]
 
 
 def build_set(obj: List, data_type: Callable[[Any], bytes]) -> bytes:
-    res = build_vlq(len(obj))
-    return res + b"".join(data_type(x) for x in obj)
+    res = [build_vlq(len(obj))]
+    res += [data_type(x) for x in obj]
+    return b"".join(res)
 
 
-def parse_hashmap(stream: BinaryIO, key_type: Callable[[BinaryIO], Hashable],
-                  value_type: Callable[[BinaryIO], Any]) -> Dict:
+def parse_hashmap(stream: BufferCursor, key_type: Callable[[BufferCursor], Hashable],
+                  value_type: Callable[[BufferCursor], Any]) -> Dict:
     map_len = parse_vlq(stream)
-    return dict((key_type(stream), value_type(stream)) for _ in range(map_len))
+    res = {}
+    for _ in range(map_len):
+        key = key_type(stream)  # Keys come first on the wire, so this can't be folded into one assignment
+        res[key] = value_type(stream)
+    return res
 
 
 def build_hashmap(obj: Dict, key_type: Callable[[Hashable], bytes],
                   value_type: Callable[[Any], bytes]) -> bytes:
-    res = build_vlq(len(obj))
-    key_list = (key_type(x) for x in obj.keys())
-    val_list = (value_type(x) for x in obj.values())
-    # noinspection PyTypeChecker
-    return res + b"".join(zip(key_list, val_list))
+    res = [build_vlq(len(obj))]
+    append = res.append
+    for key, value in obj.items():
+        append(key_type(key))
+        append(value_type(value))
+    return b"".join(res)
+
+
+def parse_struct_set(stream: BufferCursor, data_type: str) -> List:
+    """
+    Like parse_set, but for sets of a single struct type, which can be unpacked all in one go since every element
+    is the same width.
+    :param stream: A stream object of raw bytes.
+    :param data_type: str, the struct type of the elements. Valid values are listed in struct_cache.
+    :return: list: The unpacked elements, in the same form parse_with_struct would give them.
+    """
+    set_len = parse_vlq(stream)
+    s = struct_cache[data_type]
+    start = stream.pos
+    end = start + set_len * s.size
+    if len(s.format) == 2:  # Single values; unpack them flat instead of as a pile of 1-tuples
+        res = list(struct.unpack_from(f">{set_len}{s.format[1:]}", stream.buf, start))
+    else:
+        res = list(s.iter_unpack(stream.buf[start:end]))
+    stream.pos = end
+    return res
+
+
+def parse_struct_hashmap(stream: BufferCursor, key_type: str, value_type: str) -> Dict:
+    """
+    Like parse_hashmap, but for maps whose keys and values are both single struct values, so that each entry can
+    be unpacked as one fixed-width record.
+    :param stream: A stream object of raw bytes.
+    :param key_type: str, the struct type of the keys. Valid values are listed in struct_cache.
+    :param value_type: str, the struct type of the values. Valid values are listed in struct_cache.
+    :return: dict: The unpacked map.
+    """
+    map_len = parse_vlq(stream)
+    entry = _entry_structs.get((key_type, value_type))
+    if entry is None:
+        entry = struct.Struct(f">{struct_cache[key_type].format[1:]}{struct_cache[value_type].format[1:]}")
+        _entry_structs[(key_type, value_type)] = entry
+    start = stream.pos
+    end = start + map_len * entry.size
+    res = dict(entry.iter_unpack(stream.buf[start:end]))
+    stream.pos = end
+    return res
+
+
+# (key type, value type) -> Struct for one parse_struct_hashmap entry, built the first time each pairing is seen
+_entry_structs = {}
 
 
-def parse_chat_header(stream: BinaryIO) -> Dict:
+class FixedLayout:
+    """
+    A run of fixed-width fields that always appear together, folded at import time into a single Struct, so the
+    whole run can be read or written with one unpack or pack instead of one parse_with_struct per field.
+    """
+    __slots__ = ("struct", "fields")
+
+    def __init__(self, *fields):
+        """
+        :param fields: (name, data_type) pairs, in the order they appear on the wire. Valid data types are listed
+        in struct_cache.
+        """
+        layout = ">"
+        self.fields = []
+        index = 0
+        for name, data_type in fields:
+            s = struct_cache[data_type]
+            count = len(s.unpack(bytes(s.size)))
+            layout += s.format[1:]
+            self.fields.append((name, index, count))
+            index += count
+        self.struct = struct.Struct(layout)
+
+    def parse(self, stream: BufferCursor) -> Dict:
+        values = self.struct.unpack_from(stream.buf, stream.pos)
+        stream.pos += self.struct.size
+        return {name: values[index] if count == 1 else values[index:index + count]
+                for name, index, count in self.fields}
+
+    def build(self, obj: Dict) -> bytes:
+        values = []
+        for name, _, count in self.fields:
+            if count == 1:
+                values.append(obj[name])
+            else:
+                values.extend(obj[name])
+        return self.struct.pack(*values)
+
+
+def parse_chat_header(stream: BufferCursor) -> Dict:
     res = {"mode": parse_byte(stream)}
     if res["mode"] > 1:
         res["channel"] = parse_utf8_string(stream)
@@ -274,21 +577,18 @@ def build_chat_header(obj: Dict) -> bytes:
     return res
 
 
-def parse_celestial_coordinates(stream: BinaryIO) -> Dict:
-    return {
-        "coordinates": parse_with_struct(stream, "vec3i"),
-        "planet": parse_with_struct(stream, "int32"),
-        "satellite": parse_with_struct(stream, "int32")
-    }
+celestial_coordinates_layout = FixedLayout(("coordinates", "vec3i"), ("planet", "int32"), ("satellite", "int32"))
+
+
+def parse_celestial_coordinates(stream: BufferCursor) -> Dict:
+    return celestial_coordinates_layout.parse(stream)
 
 
 def build_celestial_coordinates(obj: Dict) -> bytes:
-    return b"".join((build_with_struct(obj["coordinates"], "vec3i"),
-                     build_with_struct(obj["planet"], "int32"),
-                     build_with_struct(obj["satellite"], "int32")))
+    return celestial_coordinates_layout.build(obj)
 
 
-def parse_system_location(stream: BinaryIO) -> Dict:
+def parse_system_location(stream: BufferCursor) -> Dict:
     dest_type = parse_byte(stream)
     res = {"type": dest_type}
     if dest_type == SystemLocationType.SYSTEM:
@@ -298,7 +598,7 @@ def parse_system_location(stream: BinaryIO) -> Dict:
     elif dest_type == SystemLocationType.ORBIT:
         res["coordinates"] = parse_celestial_coordinates(stream)
         res["direction"] = parse_with_struct(stream, "int32")
-        res["enter_time"] = parse_with_struct(stream, "double")
+        res["enter_time"] = parse_double(stream)
         res["enter_position"] = parse_with_struct(stream, "vec2f")
     elif dest_type == SystemLocationType.UUID:
         res["destination_id"] = parse_uuid(stream)
@@ -320,7 +620,7 @@ def build_system_location(obj: Dict) -> bytes:
         orbit_li = (
             build_celestial_coordinates(obj["coordinates"]),
             build_with_struct(obj["direction"], "int32"),
-            build_with_struct(obj["enter_time"], "double"),
+            build_double(obj["enter_time"]),
             build_with_struct(obj["enter_position"], "vec2f")
         )
         res += b"".join(orbit_li)
@@ -333,7 +633,7 @@ def build_system_location(obj: Dict) -> bytes:
     return res
 
 
-def parse_warp_action(stream: BinaryIO) -> Dict:
+def parse_warp_action(stream: BufferCursor) -> Dict:
     warp_type = parse_byte(stream)
     res = {"warp_type": warp_type}
 
@@ -345,11 +645,11 @@ def parse_warp_action(stream: BinaryIO) -> Dict:
             res["teleporter"] = parse_maybe(stream, parse_utf8_string)
         elif world_type == WarpWorldType.SHIP_WORLD:
             res["ship_owner"] = parse_uuid(stream)
-            res["start_position"] = parse_maybe(stream, lambda x: parse_with_struct(x, "vec2ui"))
+            res["start_position"] = parse_maybe(stream, parse_vec2ui)
         elif world_type == WarpWorldType.UNIQUE_WORLD:
             res["world_name"] = parse_utf8_string(stream)
             res["instance_id"] = parse_maybe(stream, parse_uuid)
-            res["level"] = parse_maybe(stream, lambda x: parse_with_struct(x, "float"))
+            res["level"] = parse_maybe(stream, parse_float)
             res["teleporter_id"] = parse_maybe(stream, parse_utf8_string)
         else:
             raise TypeError(f"World warp type {world_type} is not defined for parsing!")
@@ -378,12 +678,12 @@ def build_warp_action(obj: Dict) -> bytes:
             res += build_maybe(obj["teleporter"], build_utf8_string)
         elif world_type == WarpWorldType.SHIP_WORLD:
             res += build_uuid(obj["ship_owner"])
-            res += build_maybe(obj["start_position"], lambda x: build_with_struct(x, "vec2ui"))
+            res += build_maybe(obj["start_position"], build_vec2ui)
         elif world_type == WarpWorldType.UNIQUE_WORLD:
             data_li = (
                 build_utf8_string(obj["world_name"]),
                 build_maybe(obj["instance_id"], build_uuid),
-                build_maybe(obj["level"], lambda x: build_with_struct(x, "float")),
+                build_maybe(obj["level"], build_float),
                 build_maybe(obj["teleporter_id"], build_utf8_string)
             )
             res += b"".join(data_li)
@@ -402,7 +702,7 @@ def build_warp_action(obj: Dict) -> bytes:
     return res
 
 
-def parse_world_chunks(stream: BinaryIO) -> Dict:
+def parse_world_chunks(stream: BufferCursor) -> Dict:
     # I'll be honest, I've not a damned clue what's going on in this thing.
     # And honestly, it's doubtful we'll need any more parsing than this;
     # Python is simply too slow for us to be parsing tile arrays and such
@@ -414,27 +714,27 @@ def parse_world_chunks(stream: BinaryIO) -> Dict:
 # Specific packet parsing functions
 # These receive two arguments from parse_ or build_packet
 # Arg 1 is either the data stream or the parsed_data dict from the packet, depending on if reading or writing
-# Arg 2 is the direction the packet is going in, as a PacketDirection
+# Arg 2 is the direction the packet is going in, as enums.TO_CLIENT or enums.TO_SERVER
 # Most packets don't need the second one, but it's there when they do
 
 # Protocol packets
 # - Protocol request
 
 
-def parse_protocol_request(stream: BinaryIO, _) -> Dict:
+def parse_protocol_request(stream: BufferCursor, _) -> Dict:
     return {"request_protocol_version": parse_with_struct(stream, "uint32")}
 
 # - Protocol response
 
 
-def parse_protocol_response(stream: BinaryIO, _) -> Dict:
-    return {"allowed": parse_with_struct(stream, "bool")}
+def parse_protocol_response(stream: BufferCursor, _) -> Dict:
+    return {"allowed": parse_bool(stream)}
 
 # Universe server to client
 # - Server disconnect
 
 
-def parse_server_disconnect(stream: BinaryIO, _) -> Dict:
+def parse_server_disconnect(stream: BufferCursor, _) -> Dict:
     return {"reason": parse_utf8_string(stream)}
 
 
@@ -444,34 +744,26 @@ def build_server_disconnect(obj: Dict, _) -> bytes:
 # - Connect success
 
 
-def parse_connect_success(stream: BinaryIO, _) -> Dict:
-    return {
+connect_success_layout = FixedLayout(("planet_orbital_levels", "int32"), ("satellite_orbital_levels", "int32"),
+                                     ("chunk_size", "int32"), ("xy_coord_range", "vec2i"), ("z_coord_range", "vec2i"))
+
+
+def parse_connect_success(stream: BufferCursor, _) -> Dict:
+    res = {
         "client_id": parse_vlq(stream),
-        "server_uuid": parse_uuid(stream),
-        "planet_orbital_levels": parse_with_struct(stream, "int32"),
-        "satellite_orbital_levels": parse_with_struct(stream, "int32"),
-        "chunk_size": parse_with_struct(stream, "int32"),
-        "xy_coord_range": parse_with_struct(stream, "vec2i"),
-        "z_coord_range": parse_with_struct(stream, "vec2i")
+        "server_uuid": parse_uuid(stream)
     }
+    res.update(connect_success_layout.parse(stream))
+    return res
 
 
 def build_connect_success(obj: Dict, _) -> bytes:
-    res = [
-        build_vlq(obj["client_id"]),
-        build_uuid(obj["server_uuid"]),
-        build_with_struct(obj["planet_orbital_levels"], "int32"),
-        build_with_struct(obj["satellite_orbital_levels"], "int32"),
-        build_with_struct(obj["chunk_size"], "int32"),
-        build_with_struct(obj["xy_coord_range"], "vec2i"),
-        build_with_struct(obj["z_coord_range"], "vec2i")
-    ]
-    return b"".join(res)
+    return b"".join((build_vlq(obj["client_id"]), build_uuid(obj["server_uuid"]), connect_success_layout.build(obj)))
 
 # - Connect failure
 
 
-def parse_connect_failure(stream: BinaryIO, _) -> Dict:
+def parse_connect_failure(stream: BufferCursor, _) -> Dict:
     return {"reason": parse_utf8_string(stream)}
 
 
@@ -481,13 +773,13 @@ def build_connect_failure(obj: Dict, _) -> bytes:
 # - Handshake challenge
 
 
-def parse_handshake_challenge(stream: BinaryIO, _) -> Dict:
+def parse_handshake_challenge(stream: BufferCursor, _) -> Dict:
     return {"password_salt": parse_byte_array(stream)}
 
 # - Chat received
 
 
-def parse_chat_received(stream: BinaryIO, _) -> Dict:
+def parse_chat_received(stream: BufferCursor, _) -> Dict:
     return {
         "header": parse_chat_header(stream),
         "name": parse_utf8_string(stream),
@@ -506,76 +798,75 @@ def build_chat_received(obj: Dict, _) -> bytes:
 # - Universe time update
 
 
-def parse_universe_time_update(stream: BinaryIO, _) -> Dict:
-    return {"timestamp": parse_with_struct(stream, "double")}
+def parse_universe_time_update(stream: BufferCursor, _) -> Dict:
+    return {"timestamp": parse_double(stream)}
 
 
 def build_universe_time_update(obj: Dict, _) -> bytes:
-    return build_with_struct(obj["timestamp"], "double")
+    return build_double(obj["timestamp"])
 
 # - Player warp result
 
 
-def parse_player_warp_result(stream: BinaryIO, _) -> Dict:
+def parse_player_warp_result(stream: BufferCursor, _) -> Dict:
     return {
-        "success": parse_with_struct(stream, "bool"),
+        "success": parse_bool(stream),
         "warp_action": parse_warp_action(stream),
-        "warp_action_invalid": parse_with_struct(stream, "bool")
+        "warp_action_invalid": parse_bool(stream)
     }
 
 
 def build_player_warp_result(obj: Dict, _) -> bytes:
-    res = build_with_struct(obj["success"], "bool")
+    res = build_bool(obj["success"])
     res += build_warp_action(obj["warp_action"])
-    return res + build_with_struct(obj["warp_action_invalid"], "bool")
+    return res + build_bool(obj["warp_action_invalid"])
 
 # Universe client to server
 # - Client connect
 
 
-def parse_client_connect(stream: BinaryIO, _) -> Dict:
-    return {
+ship_upgrades_layout = FixedLayout(("ship_level", "uint32"), ("max_fuel", "uint32"), ("crew_size", "uint32"),
+                                   ("fuel_efficiency", "float"), ("ship_speed", "float"))
+
+
+def parse_client_connect(stream: BufferCursor, _) -> Dict:
+    res = {
         "assets_digest": parse_byte_array(stream),
-        "allow_assets_mismatch": parse_with_struct(stream, "bool"),
+        "allow_assets_mismatch": parse_bool(stream),
         "player_uuid": parse_uuid(stream),
         "player_name": parse_utf8_string(stream),
         "player_species": parse_utf8_string(stream),
         "ship_chunks": parse_world_chunks(stream),
-        "ship_upgrades": {
-            "ship_level": parse_with_struct(stream, "uint32"),
-            "max_fuel": parse_with_struct(stream, "uint32"),
-            "crew_size": parse_with_struct(stream, "uint32"),
-            "fuel_efficiency": parse_with_struct(stream, "float"),
-            "ship_speed": parse_with_struct(stream, "float"),
-            "ship_capabilities": parse_string_set(stream)
-        },
-        "intro_complete": parse_with_struct(stream, "bool"),
-        "account": parse_utf8_string(stream)
+        "ship_upgrades": ship_upgrades_layout.parse(stream)
     }
+    res["ship_upgrades"]["ship_capabilities"] = parse_string_set(stream)
+    res["intro_complete"] = parse_bool(stream)
+    res["account"] = parse_utf8_string(stream)
+    return res
 
 # - Handshake response
 
 
-def parse_handshake_response(stream: BinaryIO, _) -> Dict:
+def parse_handshake_response(stream: BufferCursor, _) -> Dict:
     return {"password_hash": parse_byte_array(stream)}
 
 # - Player warp-
 
 
-def parse_player_warp(stream: BinaryIO, _) -> Dict:
+def parse_player_warp(stream: BufferCursor, _) -> Dict:
     return {
         "warp_action": parse_warp_action(stream),
-        "deploy": parse_with_struct(stream, "bool")
+        "deploy": parse_bool(stream)
     }
 
 
 def build_player_warp(obj: Dict, _) -> bytes:
-    return build_warp_action(obj["warp_action"]) + build_with_struct(obj["deploy"], "bool")
+    return build_warp_action(obj["warp_action"]) + build_bool(obj["deploy"])
 
 # - Fly ship
 
 
-def parse_fly_ship(stream: BinaryIO, _) -> Dict:
+def parse_fly_ship(stream: BufferCursor, _) -> Dict:
     return {
         "system": parse_with_struct(stream, "vec3i"),
         "location": parse_system_location(stream)
@@ -588,7 +879,7 @@ def build_fly_ship(obj: Dict, _) -> bytes:
 # - Chat send
 
 
-def parse_chat_send(stream: BinaryIO, _) -> Dict:
+def parse_chat_send(stream: BufferCursor, _) -> Dict:
     return {
         "text": parse_utf8_string(stream),
         "send_mode": parse_byte(stream)
@@ -602,28 +893,29 @@ def build_chat_send(obj: Dict, _) -> bytes:
 # - World Start
 
 
-def parse_world_start(stream: BinaryIO, _) -> Dict:
-    return {
+world_start_spawn_layout = FixedLayout(("player_start", "vec2f"), ("player_respawn", "vec2f"),
+                                       ("respawn_in_world", "bool"))
+world_start_client_layout = FixedLayout(("client_id", "uint16"), ("local_interpolation_mode", "bool"))
+
+
+def parse_world_start(stream: BufferCursor, _) -> Dict:
+    res = {
         "template_data": parse_json(stream),
         "sky_data": parse_byte_array(stream),
-        "weather_data": parse_byte_array(stream),
-        "player_start": parse_with_struct(stream, "vec2f"),
-        "player_respawn": parse_with_struct(stream, "vec2f"),
-        "respawn_in_world": parse_with_struct(stream, "bool"),
-        "world_properties": parse_json(stream),
-        "dungeon_id_gravity": parse_hashmap(stream, lambda x: parse_with_struct(x, "uint16"),
-                                            lambda x: parse_with_struct(x, "float")),
-        "dungeon_id_breathable": parse_hashmap(stream, lambda x: parse_with_struct(x, "uint16"),
-                                               lambda x: parse_with_struct(x, "bool")),
-        "protected_dungeon_ids": parse_set(stream, lambda x: parse_with_struct(x, "uint16")),
-        "client_id": parse_with_struct(stream, "uint16"),
-        "local_interpolation_mode": parse_with_struct(stream, "bool")
+        "weather_data": parse_byte_array(stream)
     }
+    res.update(world_start_spawn_layout.parse(stream))
+    res["world_properties"] = parse_json(stream)
+    res["dungeon_id_gravity"] = parse_struct_hashmap(stream, "uint16", "float")
+    res["dungeon_id_breathable"] = parse_struct_hashmap(stream, "uint16", "bool")
+    res["protected_dungeon_ids"] = parse_struct_set(stream, "uint16")
+    res.update(world_start_client_layout.parse(stream))
+    return res
 
 # - Give item
 
 
-def parse_give_item(stream: BinaryIO, _) -> Dict:
+def parse_give_item(stream: BufferCursor, _) -> Dict:
     return {
         "name": parse_utf8_string(stream),
         "count": parse_vlq(stream),
@@ -638,7 +930,7 @@ def build_give_item(obj: Dict, _) -> bytes:
 # - Step update
 
 
-def parse_step_update(stream: BinaryIO, _) -> Dict:
+def parse_step_update(stream: BufferCursor, _) -> Dict:
     return {"remote_step": parse_with_struct(stream, "uint64")}
 
 # Parsing function dispatch thing
@@ -677,6 +969,10 @@ try:
 except ImportError:
     pass
 
+# Packets off the wire carry their type as a plain int, so key the map the same way; small ints are cached, so
+# lookups then match on identity instead of going through a comparison with an enum member for every packet.
+parse_map = {int(packet_type): funcs for packet_type, funcs in parse_map.items()}
+
 
 async def parse_packet(packet):
     """
@@ -684,22 +980,47 @@ async def parse_packet(packet):
     :param packet: A Packet object.
     :return: Packet: The input Packet, but with parsed data added, if applicable.
     """
+    packet.parsed_data = decode_packet(packet)
+    return packet
+
+
+def decode_packet(packet) -> Dict:
+    """
+    Parses a packet's data, going through the parse cache where it's worthwhile. This is what Packet.parsed_data
+    calls the first time it's read, so packets that nothing looks at never get parsed at all.
+    :param packet: A Packet object.
+    :return: dict: The parsed data. Empty if the packet type has no parser, or the data is incomplete.
+    """
     parse_funcs = parse_map.get(packet.type, None)
     if parse_funcs is None:
-        packet.parsed_data = {}
-    else:
-        packet_hash = hash(packet)
-        if packet_hash in _cache:
-            packet.parsed_data = _cache[packet_hash].get()
-            parser_logger.debug(f"Accessed cached packet with hash {packet_hash}.")
-            return packet
+        return {}
+    if packet.original_data is None or len(packet.original_data) < CACHE_MIN_SIZE:
+        # Not worth hashing and caching; these are as cheap to parse again as they are to look up
         try:
-            packet.parsed_data = parse_funcs[0](io.BytesIO(packet.data), packet.direction)
-            _cache[packet_hash] = CachedPacket(packet.parsed_data)
-            parser_logger.debug(f"Cached packet with hash {packet_hash}.")
+            return parse_funcs[0](BufferCursor(packet.data), packet.direction)
         except IndexError:
-            packet.parsed_data = {}
-    return packet
+            return {}
+        except Exception:
+            parser_logger.exception(f"Packet of type {packet.type} could not be parsed!", exc_info=True)
+            return {}
+    packet_hash = hash(packet)
+    cached = _cache.get(packet_hash)
+    if cached is not None:
+        _cache.move_to_end(packet_hash)
+        parser_logger.debug(f"Accessed cached packet with hash {packet_hash}.")
+        return cached.get()
+    try:
+        parsed_data = parse_funcs[0](BufferCursor(packet.data), packet.direction)
+    except IndexError:
+        return {}
+    except Exception:
+        parser_logger.exception(f"Packet of type {packet.type} could not be parsed!", exc_info=True)
+        return {}
+    _cache[packet_hash] = CachedPacket(parsed_data.copy())
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    parser_logger.debug(f"Cached packet with hash {packet_hash}.")
+    return parsed_data
 
 
 async def build_packet(packet):
@@ -713,15 +1034,23 @@ async def build_packet(packet):
         raise NotImplementedError
     else:
         try:
-            packet.data = parse_funcs[1](packet.parsed_data, packet.direction)
-            packet.size = len(packet.data)
+            data = parse_funcs[1](packet.parsed_data, packet.direction)
+            packet.data = data
+            packet.size = len(data)
             if packet.compressed:
-                size_bytes = build_signed_vlq(-packet.size)
-                data_bytes = zlib.compress(packet.data)
+                if len(data) > COMPRESS_OFFLOAD_SIZE:
+                    payload = await get_running_loop().run_in_executor(None, zlib.compress, data, COMPRESSION_LEVEL)
+                else:
+                    payload = zlib.compress(data, COMPRESSION_LEVEL)
+                # Small packets can come out of zlib bigger than they went in; those go out uncompressed instead
+                if len(payload) >= len(data):
+                    packet.compressed = False
+                    payload = data
             else:
-                size_bytes = build_signed_vlq(packet.size)
-                data_bytes = packet.data
-            packet.original_data = b"".join((build_byte(packet.type), size_bytes, data_bytes))
+                payload = data
+            # The size on the wire is that of the payload as sent, negated if it's compressed
+            size_bytes = build_signed_vlq(-len(payload) if packet.compressed else len(payload))
+            packet.original_data = b"".join((build_byte(packet.type), size_bytes, payload))
         except IndexError:
             raise NotImplementedError
         return packet
@@ -732,23 +1061,30 @@ async def reap_packets(reap_time):
     try:
         while True:
             await sleep(reap_time)
-            for p_hash, packet in _cache.copy().items():
-                if packet.reap_check():
-                    del _cache[p_hash]
+            cutoff = monotonic() - reap_time
+            # The cache is kept in least-recently-used order, so everything that's gone stale is at the front
+            while _cache:
+                p_hash, packet = next(iter(_cache.items()))
+                if packet.last_used > cutoff:
+                    break
+                del _cache[p_hash]
     except Exception:
         parser_logger.exception("Exception occurred while reaping packets.", exc_info=True)
 
 
 class CachedPacket:
+    """
+    Holds on to a packet's parsed data. Every packet that hits the cache gets its own shallow copy, so hooks can
+    set top-level keys freely; nested values (dicts, lists, JSON objects) are still shared with the cache and with
+    every other hit, so those must be replaced rather than changed in place.
+    """
+
+    __slots__ = ("last_used", "_parsed_data")
 
     def __init__(self, parsed_data):
-        self._count = 1
+        self.last_used = monotonic()
         self._parsed_data = parsed_data
 
     def get(self):
-        self._count += 1
+        self.last_used = monotonic()
         return self._parsed_data.copy()
-
-    def reap_check(self):
-        self._count -= 1
-        return self._count <= 0
@@ -6,7 +6,7 @@ from inspect import getmembers, isclass, ismethod
 from pathlib import Path
 
 from .command_dispatcher import CommandDispatcher
-from .enums import PacketType
+from .enums import CHAT_SENT, PACKET_TYPE_NAMES, PacketType
 from .parser import reap_packets
 
 
@@ -22,9 +22,9 @@ class PluginManager:
         self.load_from_path(Path(self.config_manager.config["system_plugin_path"]))
         self.load_from_path(Path(self.config_manager.config["user_plugin_path"]))
         self.command_dispatcher = CommandDispatcher(factory)
-        self.event_hooks = {packet: [] for packet in PacketType}
+        self.event_hooks = {int(packet): [] for packet in PacketType}
         # Just gonna slot this in here for now. I'm sure it can be done better but this'll work for testing.
-        self.event_hooks[PacketType.CHAT_SENT].append(self.command_dispatcher.command_check)
+        self.event_hooks[CHAT_SENT].append(self.command_dispatcher.command_check)
         self.resolve_dependencies()
         self.detect_event_hooks()
         self.reaper_task = None
@@ -100,19 +100,14 @@ class PluginManager:
         self.logger.debug(f"Event hooks: {self.event_hooks}")
 
     async def hook_event(self, packet, client):
-        event = PacketType(packet.type)
         send_ahead = True
-        if self.event_hooks[event]:
-            # noinspection PyBroadException
-            try:
-                packet = await packet.parse()
-                if not self.reaper_task:
-                    self.reaper_task = create_task(reap_packets(60))
-            except NotImplementedError:
-                self.logger.debug(f"Packet of type {event.name} is not implemented.")
-            except Exception:
-                self.logger.exception(f"Packet of type {event.name} could not be parsed!", exc_info=True)
-            for func in self.event_hooks[event]:
+        hooks = self.event_hooks.get(packet.type)
+        if hooks:
+            event = PACKET_TYPE_NAMES.get(packet.type, packet.type)
+            # The packet parses itself the first time a hook reads its parsed_data
+            if not self.reaper_task:
+                self.reaper_task = create_task(reap_packets(60))
+            for func in hooks:
                 # noinspection PyBroadException
                 try:
                     if not (await func(packet, client)):
@@ -2,13 +2,15 @@ import asyncio
 import logging
 from traceback import format_exception
 
-from .enums import PacketDirection
-from .enums import PacketDirection, PacketType, ChatReceiveMode
+from .enums import TO_CLIENT, TO_SERVER, PacketType, ChatReceiveMode
 from .plugin_manager import PluginManager
-from .packet import read_packet, Packet
+from .packet import Packet, PacketReader
 from .storage_manager import StorageManager
 from .player_manager import PlayerManager
 
+# Stream buffer limit; large world packets would otherwise keep pausing and resuming the transport.
+STREAM_LIMIT = 1 << 20
+
 
 class ClientSideConnectionFactory:
     clients = []
@@ -53,14 +55,16 @@ class Client:
         """
         conf = self.config_manager.config
         self._client_reader, self._client_writer = await asyncio.open_connection(conf["upstream_host"],
-                                                                                 conf["upstream_port"])
+                                                                                 conf["upstream_port"],
+                                                                                 limit=STREAM_LIMIT)
         self.client_loop = asyncio.create_task(self.client_listener())
+        reader = PacketReader(self._reader, TO_SERVER)
         # noinspection PyBroadException
         try:
             while True:
-                packet = await read_packet(self._reader, PacketDirection.TO_SERVER)
-                if await self.plugin_manager.hook_event(packet, self):
-                    await self.write_to_server(packet)
+                for packet in await reader.read_packets():
+                    if await self.plugin_manager.hook_event(packet, self):
+                        await self.write_to_server(packet)
         except asyncio.IncompleteReadError as e:
             exception_text = "\n".join(format_exception(*e))
             self.logger.debug(f"Incomplete read occurred. Details:\n{exception_text}")
@@ -79,11 +83,12 @@ class Client:
         """
         Listens for packets going from server to this client.
         """
+        reader = PacketReader(self._client_reader, TO_CLIENT)
         try:
             while True:
-                packet = await read_packet(self._client_reader, PacketDirection.TO_CLIENT)
-                if await self.plugin_manager.hook_event(packet, self):
-                    await self.write_to_client(packet)
+                for packet in await reader.read_packets():
+                    if await self.plugin_manager.hook_event(packet, self):
+                        await self.write_to_client(packet)
         except (asyncio.IncompleteReadError, asyncio.CancelledError) as e:
             exception_text = "\n".join(format_exception(*e))
             self.logger.debug(f"Client connection was cancelled. Details:\n{exception_text}")
@@ -103,7 +108,7 @@ class Client:
         # noinspection PyBroadException
         try:
             msg_packet = await Packet.from_parsed(PacketType.CHAT_RECEIVED, packet_data,
-                                                  direction=PacketDirection.TO_CLIENT)
+                                                  direction=TO_CLIENT)
             await self.write_to_client(msg_packet)
         except Exception:
             self.logger.exception("Exception occurred while sending message packet.", exc_info=True)
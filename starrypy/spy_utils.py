@@ -1,32 +1,38 @@
-async def read_vlq(stream):
+from logging.handlers import RotatingFileHandler
+
+
+class FastRotatingFileHandler(RotatingFileHandler):
     """
-    Reads a VLQ from a stream, and returns both the parsed value and the bytes belonging to it.
-    :param stream: A stream object, with readexactly() defined.
-    :return: int, bytes: The parsed value and unparsed value of the VLQ.
+    A RotatingFileHandler that keeps a running tally of the log file's size, so that deciding whether or not to roll
+    over doesn't require a seek/tell and a stat of the file on every record.
     """
-    raw_bytes = b""
-    value = 0
-    while True:
-        tmp = await stream.readexactly(1)
-        raw_bytes += tmp
-        tmp = ord(tmp)
-        value <<= 7
-        value |= tmp & 0x7f
-
-        if tmp & 0x80 == 0:
-            break
+    _cached_size = 0
+    _record_size = 0
 
-    return value, raw_bytes
+    def _open(self):
+        stream = super()._open()
+        self._cached_size = stream.tell()
+        return stream
 
+    def shouldRollover(self, record):
+        if self.stream is None or self.maxBytes <= 0:
+            return False
+        msg = self.format(record)
+        # The file is written encoded, so non-ASCII records (player names, chat) take up more bytes than characters.
+        if not msg.isascii():
+            msg = msg.encode(self.encoding or "utf-8", "replace")
+        self._record_size = len(msg) + len(self.terminator)
+        if self._cached_size + self._record_size < self.maxBytes:
+            self._cached_size += self._record_size
+            return False
+        if super().shouldRollover(record):
+            return True
+        # Not a regular file (or our tally drifted), so resync with the real position.
+        self._cached_size = self.stream.tell() + self._record_size
+        return False
 
-async def read_vlq_signed(stream):
-    """
-    Much like read_vlq, but accounts for signedness.
-    :param stream: A stream object, with readexactly() defined.
-    :return: int, bytes: The parsed value and unparsed value of the VLQ.
-    """
-    value, raw_bytes = await read_vlq(stream)
-    if (value & 1) == 0x00:
-        return value >> 1, raw_bytes
-    else:
-        return -((value >> 1) + 1), raw_bytes
+    def doRollover(self):
+        super().doRollover()
+        # The record that triggered the rollover is about to be written to the fresh file.
+        self._cached_size = self._record_size if self.stream else 0
+        self._record_size = 0